@@ -6,16 +6,73 @@ using Together.ai reasoning model for better quality extraction.
 
 import os
 import json
+import hashlib
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import orjson
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, List, Dict, Optional, Tuple
 
 # Together.ai API configuration
-TOGETHER_API_URL = "https://api.together.xyz/v1/chat/completions"
+TOGETHER_API_BASE = "https://api.together.xyz/v1"
+TOGETHER_API_URL = f"{TOGETHER_API_BASE}/chat/completions"
 TOGETHER_MODEL = "pavneet2612_b8db/Qwen/Qwen3-Next-80B-A3B-Thinking-cd128eab"
 
+# AI results are cached here, keyed by a hash of the full request body
+# (model, prompt with the transcript, and sampling settings)
+CACHE_DIR = Path(__file__).parent / '.cache'
+
+# Seconds between batch status checks (batch jobs usually take minutes to hours)
+BATCH_POLL_INTERVAL = 60
+# Id of the batch in flight, so an interrupted run can resume polling it
+BATCH_STATE_FILE = CACHE_DIR / 'batch.json'
+
+# Fallback when the Batch API is unavailable: concurrent direct requests,
+# started at most once per REQUEST_INTERVAL seconds across all workers
+MAX_WORKERS = 8
+REQUEST_INTERVAL = 1.0
+
+# Shared session so direct requests reuse TCP/TLS connections, with retries
+# (and backoff) for rate limiting. Completion POSTs are billed, so only retry
+# when the request was refused: connection errors, 429 and 503. Never retry
+# after a read timeout, a dropped response or a 500/502/504, which often means
+# a gateway gave up while the server went on to run (and bill) the completion.
+# Batch status checks retry other 5xx themselves in submit_batch.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=5,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[429, 503],
+        respect_retry_after_header=True,
+        allowed_methods=None
+    )
+))
+
+# Transcript parsing patterns, compiled once at import
+# Speaker lines; the lookahead skips lines without a colon before any backtracking
+SPEAKER_LINE_RE = re.compile(r'^(?=[^:\n]*:)([^:\(\n]+)(?:\([^)\n]+\))?:(.*)', re.MULTILINE)
+# Non-blank lines that don't look like a new speaker ("Name ...:")
+CONTINUATION_LINE_RE = re.compile(r'^(?![A-Z][^:\n]*:)[^\S\n]*(\S.*)', re.MULTILINE)
+TIMESTAMP_RE = re.compile(r'\([^)]*:\d{2}:\d{2}[^)]*\)')
+SPEAKER_LABEL_RE = re.compile(r'^[^:\(]+(?:\([^)]+\))?:\s*', re.MULTILINE)
+SPONSOR_RE = re.compile(r'This episode is brought to you by.*?\.', re.DOTALL | re.IGNORECASE)
+GUEST_INTRO_RE = re.compile(r'Today my guest is.*?\.', re.DOTALL | re.IGNORECASE)
+CONVERSATION_INTRO_RE = re.compile(r'In our conversation.*?\.', re.DOTALL | re.IGNORECASE)
+# Searched per line, up to the line's last "?", to spot Lenny's questions
+QUESTION_KEYWORD_RE = re.compile(r'what|how|why|when|where|tell me|can you|would you', re.IGNORECASE)
+EXTRA_NEWLINES_RE = re.compile(r'\n\s*\n\s*\n+')
+JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
 # Get API key from environment variable
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 if not TOGETHER_API_KEY:
@@ -30,56 +87,58 @@ def extract_speaker_content(text: str, speaker_name: str) -> str:
 
 def filter_guest_content(text: str, guest_name: str) -> str:
     """Extract only content from the guest, excluding Lenny's questions and comments."""
-    lines = text.split('\n')
     guest_lines = []
     current_speaker = None
     
     # Common patterns for Lenny's lines
     lenny_patterns = ['lenny', 'lennie', 'host']
+    guest_name_lower = guest_name.lower()
+    guest_words = [re.escape(word.lower()) for word in guest_name.split() if len(word) > 3]
+    guest_words_re = re.compile('|'.join(guest_words)) if guest_words else None
     
-    for line in lines:
-        # Check if line starts with a speaker name (various formats)
-        # Format: "Speaker (timestamp): content" or "Speaker: content" or "(timestamp): content"
-        speaker_match = re.match(r'^([^:\(]+)(?:\([^)]+\))?:\s*(.*)', line)
+    # Walk the speaker lines in one regex scan
+    # Format: "Speaker (timestamp): content" or "Speaker: content" or "(timestamp): content"
+    position = 0
+    for speaker_match in SPEAKER_LINE_RE.finditer(text):
+        # Continue guest's thought if no new speaker (multi-line responses)
+        if current_speaker == 'guest':
+            guest_lines.extend(line.strip() for line in
+                               CONTINUATION_LINE_RE.findall(text, position, speaker_match.start()))
+        position = speaker_match.end()
         
-        if speaker_match:
-            speaker = speaker_match.group(1).strip()
-            content = speaker_match.group(2).strip()
-            
-            # Normalize speaker names
-            speaker_lower = speaker.lower()
-            
-            # Skip Lenny's lines (explicit check)
-            is_lenny = any(pattern in speaker_lower for pattern in lenny_patterns)
-            if is_lenny:
-                current_speaker = 'lenny'
-                continue
+        speaker = speaker_match.group(1).strip()
+        content = speaker_match.group(2).strip()
+        
+        # Normalize speaker names
+        speaker_lower = speaker.lower()
+        
+        # Skip Lenny's lines (explicit check)
+        if any(pattern in speaker_lower for pattern in lenny_patterns):
+            current_speaker = 'lenny'
+            continue
+        
+        # If we have a guest name, check if this is the guest
+        if guest_name:
+            # Check if speaker matches guest name (full or partial)
+            is_guest = (guest_name_lower in speaker_lower or 
+                       (guest_words_re and guest_words_re.search(speaker_lower)) or
+                       speaker_lower in guest_name_lower)
             
-            # If we have a guest name, check if this is the guest
-            if guest_name:
-                guest_name_lower = guest_name.lower()
-                # Check if speaker matches guest name (full or partial)
-                is_guest = (guest_name_lower in speaker_lower or 
-                           any(word.lower() in speaker_lower for word in guest_name.split() if len(word) > 3) or
-                           speaker_lower in guest_name_lower)
-                
-                if is_guest and not is_lenny:
-                    current_speaker = 'guest'
-                    if content:
-                        guest_lines.append(content)
-                # If it's not clearly Lenny or guest, assume it's guest if we're already in guest mode
-                elif current_speaker == 'guest' and content and not is_lenny:
+            if is_guest:
+                current_speaker = 'guest'
+                if content:
                     guest_lines.append(content)
-            else:
-                # No guest name provided - include anything that's not Lenny
-                if not is_lenny and content:
-                    current_speaker = 'guest'
-                    guest_lines.append(content)
-        # Continue guest's thought if no new speaker (multi-line responses)
-        elif current_speaker == 'guest' and line.strip():
-            # Skip if it looks like a new speaker line
-            if not re.match(r'^[A-Z][^:]*:\s*', line):
-                guest_lines.append(line.strip())
+            # If it's not clearly Lenny or guest, assume it's guest if we're already in guest mode
+            elif current_speaker == 'guest' and content:
+                guest_lines.append(content)
+        else:
+            # No guest name provided - include anything that's not Lenny
+            if content:
+                current_speaker = 'guest'
+                guest_lines.append(content)
+    
+    if current_speaker == 'guest':
+        guest_lines.extend(line.strip() for line in CONTINUATION_LINE_RE.findall(text, position))
     
     return '\n'.join(guest_lines)
 
@@ -89,30 +148,33 @@ def clean_transcript(text: str, guest_name: str = None) -> str:
     text = filter_guest_content(text, guest_name or "")
     
     # Remove any remaining timestamps
-    text = re.sub(r'\([^)]*:\d{2}:\d{2}[^)]*\)', '', text)
+    text = TIMESTAMP_RE.sub('', text)
     # Remove speaker names with timestamps that might remain
-    text = re.sub(r'^[^:\(]+(?:\([^)]+\))?:\s*', '', text, flags=re.MULTILINE)
+    text = SPEAKER_LABEL_RE.sub('', text)
     # Remove sponsor segments (common patterns)
-    text = re.sub(r'This episode is brought to you by.*?\.', '', text, flags=re.DOTALL | re.IGNORECASE)
+    text = SPONSOR_RE.sub('', text)
     # Remove Lenny's intro patterns (in case they slipped through)
-    text = re.sub(r'Today my guest is.*?\.', '', text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r'In our conversation.*?\.', '', text, flags=re.DOTALL | re.IGNORECASE)
-    # Remove lines that are clearly from Lenny (questions, intros)
-    text = re.sub(r'^.*(?:what|how|why|when|where|tell me|can you|would you).*\?.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
+    text = GUEST_INTRO_RE.sub('', text)
+    text = CONVERSATION_INTRO_RE.sub('', text)
+    # Remove lines that are clearly from Lenny (questions, intros): a question
+    # keyword somewhere before a "?". Lines without "?" give rfind() == -1,
+    # which search() treats as an empty range.
+    text = '\n'.join('' if QUESTION_KEYWORD_RE.search(line, 0, line.rfind('?')) else line
+                     for line in text.split('\n'))
     # Remove excessive whitespace
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
+    text = EXTRA_NEWLINES_RE.sub('\n\n', text)
     # Limit length to avoid token limits (keep first 15000 chars)
     if len(text) > 15000:
         text = text[:15000] + "... [truncated]"
     return text.strip()
 
-def extract_metadata_with_ai(transcript: str, episode_name: str, guest_name: str = None) -> Optional[Dict]:
-    """
-    Use Together.ai API to extract key takeaways and metadata tags.
+def build_request(transcript: str, episode_name: str, guest_name: str = None) -> Dict:
     """
-    if not TOGETHER_API_KEY:
-        return None
+    Build the Together.ai request for one episode.
     
+    Returns a batch record ({"custom_id": ..., "body": ...}); the body is also
+    the payload for a direct /chat/completions call.
+    """
     # Clean the transcript, excluding Lenny's content
     cleaned_transcript = clean_transcript(transcript, guest_name)
     
@@ -179,13 +241,10 @@ Please respond in JSON format:
   ]
 }}"""
 
-    try:
-        headers = {
-            "Authorization": f"Bearer {TOGETHER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
+    return {
+        # Batch API custom_ids are limited to 64 characters
+        "custom_id": episode_name[:64],
+        "body": {
             "model": TOGETHER_MODEL,
             "messages": [
                 {
@@ -196,38 +255,68 @@ Please respond in JSON format:
             "temperature": 0.3,
             "max_tokens": 2000
         }
+    }
+
+def parse_ai_response(result: Dict) -> Optional[Dict]:
+    """Extract the metadata JSON from a chat completion response."""
+    if 'choices' in result and len(result['choices']) > 0:
+        content = result['choices'][0]['message']['content']
         
-        response = requests.post(TOGETHER_API_URL, headers=headers, json=payload, timeout=120)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Extract the content from the response
-        if 'choices' in result and len(result['choices']) > 0:
-            content = result['choices'][0]['message']['content']
-            
-            # Try to extract JSON from the response
-            # Look for JSON block in markdown code fences or plain JSON
-            json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', content, re.DOTALL)
-            if json_match:
-                content = json_match.group(1)
-            else:
-                # Try to find JSON object directly
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    content = json_match.group(0)
-            
-            # Parse JSON
-            try:
-                extracted_data = json.loads(content)
-                return extracted_data
-            except json.JSONDecodeError as e:
-                print(f"  Warning: Could not parse JSON from response: {e}")
-                print(f"  Response content: {content[:500]}")
-                return None
+        # Try to extract JSON from the response
+        # Look for JSON block in markdown code fences or plain JSON
+        json_match = JSON_FENCE_RE.search(content)
+        if json_match:
+            content = json_match.group(1)
         else:
-            print(f"  Warning: Unexpected API response format")
+            # Try to find JSON object directly
+            json_match = JSON_OBJECT_RE.search(content)
+            if json_match:
+                content = json_match.group(0)
+        
+        # Parse JSON
+        try:
+            extracted_data = orjson.loads(content)
+            return extracted_data
+        except orjson.JSONDecodeError as e:
+            print(f"  Warning: Could not parse JSON from response: {e}")
+            print(f"  Response content: {content[:500]}")
             return None
+    else:
+        print(f"  Warning: Unexpected API response format")
+        return None
+
+class RateLimiter:
+    """Spaces out calls from any number of threads to one per interval."""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+    
+    def wait(self):
+        """Block until the caller's slot comes up."""
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+REQUEST_LIMITER = RateLimiter(REQUEST_INTERVAL)
+
+def request_completion(payload: Dict) -> Optional[Dict]:
+    """Send one chat completion request and parse the metadata from it."""
+    try:
+        headers = {
+            "Authorization": f"Bearer {TOGETHER_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        REQUEST_LIMITER.wait()
+        response = SESSION.post(TOGETHER_API_URL, headers=headers, json=payload, timeout=120)
+        response.raise_for_status()
+        
+        return parse_ai_response(response.json())
             
     except requests.exceptions.RequestException as e:
         print(f"  Error calling API: {e}")
@@ -236,36 +325,280 @@ Please respond in JSON format:
         print(f"  Unexpected error: {e}")
         return None
 
+def extract_metadata_with_ai(transcript: str, episode_name: str, guest_name: str = None) -> Optional[Dict]:
+    """
+    Use Together.ai API to extract key takeaways and metadata tags.
+    """
+    if not TOGETHER_API_KEY:
+        return None
+    
+    return request_completion(build_request(transcript, episode_name, guest_name)['body'])
+
+def submit_direct_requests(batch_requests: List[Dict],
+                           on_result: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, Dict]:
+    """
+    Send batch records straight to /chat/completions from a thread pool.
+    
+    Used when the Batch API is unavailable. Returns the parsed metadata keyed
+    by custom_id, like submit_batch. on_result, if given, is called with each
+    successful (custom_id, result) as soon as it arrives, so finished work can
+    be saved before the rest completes.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(request_completion, request['body']): request['custom_id']
+            for request in batch_requests
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            custom_id = futures[future]
+            ai_result = future.result()
+            print(f"[{i}/{len(futures)}] {'Done' if ai_result else 'Failed'}: {custom_id}")
+            if ai_result:
+                results[custom_id] = ai_result
+                if on_result:
+                    on_result(custom_id, ai_result)
+    
+    return results
+
+def load_batch_state(request_digests: List[str]) -> Optional[str]:
+    """Return the id of an unfinished batch that covers all of these requests, if any."""
+    try:
+        state = orjson.loads(BATCH_STATE_FILE.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        print(f"  Warning: Ignoring unreadable batch state file: {e}")
+        return None
+    # A subset still matches: requests whose results were saved before an
+    # interruption drop out of the next run, but the rest are in the batch
+    if not set(request_digests) <= set(state.get('request_digests') or []):
+        print(f"  Note: batch {state.get('batch_id')} from an earlier run was for different requests; "
+              f"cancel it in the Together.ai dashboard if it is still running")
+        return None
+    return state.get('batch_id')
+
+def save_batch_state(batch_id: str, request_digests: List[str]):
+    """Remember a submitted batch so a re-run can resume polling it."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    temp_file = BATCH_STATE_FILE.with_name(f"{BATCH_STATE_FILE.name}.tmp")
+    temp_file.write_bytes(orjson.dumps({"batch_id": batch_id, "request_digests": request_digests}))
+    os.replace(temp_file, BATCH_STATE_FILE)
+
+def clear_batch_state():
+    """Forget the saved batch once its results are saved or it can't produce any."""
+    BATCH_STATE_FILE.unlink(missing_ok=True)
+
+def submit_batch(batch_requests: List[Dict]) -> Optional[Dict[str, Dict]]:
+    """
+    Run requests through the Together.ai Batch API and wait for the results.
+    
+    Uploads all requests as one JSONL file, creates a batch job against
+    /v1/chat/completions and polls it until it finishes. The batch id is saved
+    so a re-run with the same requests resumes polling instead of paying for
+    them again; the caller clears it with clear_batch_state() once the results
+    are saved. Returns the parsed metadata keyed by custom_id, or None only
+    if the batch could not be submitted (nothing was sent for processing).
+    """
+    if not TOGETHER_API_KEY:
+        return None
+    
+    headers = {"Authorization": f"Bearer {TOGETHER_API_KEY}"}
+    batch_lines = [orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE) for r in batch_requests]
+    batch_jsonl = b''.join(batch_lines)
+    request_digests = sorted(hashlib.sha256(line).hexdigest() for line in batch_lines)
+    
+    batch_id = load_batch_state(request_digests)
+    if batch_id:
+        print(f"Resuming batch {batch_id} from an earlier run")
+        batch = {}
+    else:
+        try:
+            # Upload the requests as a single JSONL file
+            response = requests.post(
+                f"{TOGETHER_API_BASE}/files/upload",
+                headers=headers,
+                data={"purpose": "batch-api", "file_name": "episodes_batch.jsonl"},
+                files={"file": ("episodes_batch.jsonl", batch_jsonl)},
+                timeout=300
+            )
+            response.raise_for_status()
+            file_id = response.json()['id']
+            
+            # Create the batch job
+            response = requests.post(
+                f"{TOGETHER_API_BASE}/batches",
+                headers=headers,
+                json={"input_file_id": file_id, "endpoint": "/v1/chat/completions"},
+                timeout=120
+            )
+            response.raise_for_status()
+            batch = response.json()
+            batch = batch.get('job', batch)
+            batch_id = batch['id']
+        except requests.exceptions.RequestException as e:
+            print(f"  Error calling batch API: {e}")
+            return None
+        except (KeyError, ValueError) as e:
+            print(f"  Unexpected batch API response: {e}")
+            return None
+        
+        save_batch_state(batch_id, request_digests)
+        print(f"Submitted batch {batch_id} ({len(batch_requests)} requests)")
+    
+    # From here on the batch is running (and billed), so transient errors are
+    # retried rather than falling back to direct requests
+    while True:
+        try:
+            status = str(batch.get('status', '')).upper()
+            if status == 'COMPLETED':
+                output_file_id = batch.get('output_file_id')
+                if not output_file_id:
+                    # Every request failed, so the batch only has an error file
+                    print(f"  Batch {batch_id} completed without output "
+                          f"(error file: {batch.get('error_file_id')})")
+                    clear_batch_state()
+                    return {}
+                
+                # Download the results
+                response = SESSION.get(
+                    f"{TOGETHER_API_BASE}/files/{output_file_id}/content",
+                    headers=headers,
+                    timeout=300
+                )
+                response.raise_for_status()
+                content = response.content
+                break
+            if status in ('FAILED', 'EXPIRED', 'CANCELLED'):
+                print(f"  Batch {batch_id} ended with status {status}")
+                clear_batch_state()
+                return {}
+            if status:
+                print(f"  Batch status: {status}, checking again in {BATCH_POLL_INTERVAL}s...")
+                time.sleep(BATCH_POLL_INTERVAL)
+            response = SESSION.get(f"{TOGETHER_API_BASE}/batches/{batch_id}", headers=headers, timeout=120)
+            response.raise_for_status()
+            batch = response.json()
+            batch = batch.get('job', batch)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.RetryError) as e:
+            print(f"  Error checking batch {batch_id}: {e}, retrying in {BATCH_POLL_INTERVAL}s...")
+            batch = {}
+            time.sleep(BATCH_POLL_INTERVAL)
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code
+            if status_code == 429 or status_code >= 500:
+                print(f"  Error checking batch {batch_id}: {e}, retrying in {BATCH_POLL_INTERVAL}s...")
+                batch = {}
+                time.sleep(BATCH_POLL_INTERVAL)
+                continue
+            # Other client errors (revoked key, unknown batch id) won't go away by retrying
+            print(f"  Error checking batch {batch_id}: {e}, giving up on this batch")
+            clear_batch_state()
+            return {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Keep the batch id so a re-run can resume polling it
+            print(f"  Unexpected error checking batch {batch_id}: {e}; "
+                  f"run the script again to resume")
+            return {}
+    
+    # Map each result line back to its request by custom_id
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            print(f"  Warning: Could not parse batch output line: {e}")
+            continue
+        
+        custom_id = record.get('custom_id')
+        record_response = record.get('response') or {}
+        completion = record_response.get('body', record_response)
+        if not completion:
+            print(f"  Warning: No response for {custom_id}: {record.get('error')}")
+            continue
+        
+        ai_result = parse_ai_response(completion)
+        if ai_result:
+            results[custom_id] = ai_result
+    
+    return results
+
+def get_cache_path(body: Dict) -> Path:
+    """Return the cache file for a request body, so any change to the request misses the cache."""
+    digest = hashlib.sha256(orjson.dumps(body, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return CACHE_DIR / f"{digest}.json"
+
+def load_cached_result(cache_file: Path) -> Optional[Dict]:
+    """Return the cached AI result, or None if there isn't a readable one."""
+    try:
+        return orjson.loads(cache_file.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        print(f"  Warning: Ignoring unreadable cache file {cache_file.name}: {e}")
+        return None
+
+def save_cached_result(cache_file: Path, ai_result: Dict):
+    """Store an AI result in the cache."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    # Write to a temp file and rename it, so an interrupted write never leaves a partial entry
+    temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_file.write_bytes(orjson.dumps(ai_result))
+    os.replace(temp_file, cache_file)
+
+def load_transcript(file_path: Path, episode_name: str) -> Tuple[str, str]:
+    """Read a transcript and return its content and guest name."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Extract guest name (usually the first speaker that's not "Lenny")
+    guest_name = None
+    # maxsplit stops after the first 20 lines instead of splitting the whole file
+    for line in content.split('\n', 20)[:20]:  # Check first 20 lines
+        if ':' in line and 'Lenny' not in line and '(' in line:
+            guest_name = line.split('(')[0].strip()
+            break
+    
+    if not guest_name:
+        guest_name = episode_name
+    
+    return content, guest_name
+
+def build_episode_data(file_path: Path, episode_name: str, guest_name: str, ai_result: Dict) -> Dict:
+    """Combine the AI result with the episode's details."""
+    return {
+        'episode_name': episode_name,
+        'guest_name': guest_name,
+        'key_takeaways': ai_result.get('key_takeaways', [])[:5],
+        'metadata_tags': ai_result.get('metadata_tags', [])[:5],
+        'file_path': str(file_path)
+    }
+
 def process_transcript(file_path: Path, episode_name: str) -> Optional[Dict]:
     """Process a single transcript file using AI."""
     try:
         print(f"Processing: {episode_name}")
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Extract guest name (usually the first speaker that's not "Lenny")
-        guest_name = None
-        lines = content.split('\n')
-        for line in lines[:20]:  # Check first 20 lines
-            if ':' in line and 'Lenny' not in line and '(' in line:
-                guest_name = line.split('(')[0].strip()
-                break
-        
-        if not guest_name:
-            guest_name = episode_name
+        content, guest_name = load_transcript(file_path, episode_name)
         
-        # Use AI to extract metadata (pass guest_name to exclude Lenny's content)
-        ai_result = extract_metadata_with_ai(content, episode_name, guest_name)
+        # Reuse the cached result if this exact request was already sent
+        # (pass guest_name to exclude Lenny's content)
+        request = build_request(content, episode_name, guest_name)
+        cache_file = get_cache_path(request['body'])
+        ai_result = load_cached_result(cache_file)
+        if ai_result:
+            print(f"  Using cached result")
+        else:
+            # Use AI to extract metadata
+            ai_result = request_completion(request['body'])
+            if ai_result:
+                save_cached_result(cache_file, ai_result)
         
         if ai_result:
-            return {
-                'episode_name': episode_name,
-                'guest_name': guest_name,
-                'key_takeaways': ai_result.get('key_takeaways', [])[:5],
-                'metadata_tags': ai_result.get('metadata_tags', [])[:5],
-                'file_path': str(file_path)
-            }
+            return build_episode_data(file_path, episode_name, guest_name, ai_result)
         else:
             print(f"  Failed to extract metadata with AI, skipping...")
             return None
@@ -282,76 +615,134 @@ def main():
         return
     
     base_dir = Path(__file__).parent
-    transcript_files = list(base_dir.glob('*.txt'))
-    
-    # Filter out special files
-    transcript_files = [f for f in transcript_files if f.name not in ['extract_metadata.py', 'extract_metadata_ai.py']]
+    skip_files = {'extract_metadata.py', 'extract_metadata_ai.py'}
+    with os.scandir(base_dir) as entries:
+        transcript_files = [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and entry.name.endswith('.txt') and entry.name not in skip_files
+        ]
     
     print(f"Found {len(transcript_files)} transcript files")
     print(f"Using Together.ai model: {TOGETHER_MODEL}")
-    print(f"Processing will take some time due to API calls...\n")
+    print(f"Episodes are submitted as one batch job, which can take a while to complete...\n")
     
     # Load existing metadata if it exists (for resuming)
     output_file = base_dir / 'episodes_metadata.json'
     existing_episodes = {}
     if output_file.exists():
         try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-                if 'episodes' in existing_data:
-                    for ep in existing_data['episodes']:
-                        existing_episodes[ep['episode_name']] = ep
-            print(f"Loaded {len(existing_episodes)} existing episodes (will skip if already processed)")
+            existing_data = orjson.loads(output_file.read_bytes())
+            if 'episodes' in existing_data:
+                for ep in existing_data['episodes']:
+                    existing_episodes[ep['episode_name']] = ep
         except:
             pass
     
-    episodes = []
+    # Episodes finished by an interrupted run are appended to the progress file
+    progress_file = base_dir / 'episodes_metadata.jsonl'
+    if progress_file.exists():
+        with open(progress_file, 'rb') as f:
+            for line in f:
+                try:
+                    ep = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                existing_episodes[ep['episode_name']] = ep
+    
+    if existing_episodes:
+        print(f"Loaded {len(existing_episodes)} existing episodes (will skip if already processed)")
+    
+    results = {}
+    pending = []
     processed_count = 0
     skipped_count = 0
     failed_count = 0
     
-    for i, file_path in enumerate(transcript_files, 1):
-        episode_name = file_path.stem
-        
-        # Skip if already processed
-        if episode_name in existing_episodes:
-            print(f"[{i}/{len(transcript_files)}] Skipping (already processed): {episode_name}")
-            episodes.append(existing_episodes[episode_name])
-            skipped_count += 1
-            continue
-        
-        print(f"[{i}/{len(transcript_files)}] Processing: {episode_name}")
+    with open(progress_file, 'ab') as progress_f:
+        def save_progress(episode_data: Dict):
+            """Append a finished episode to the progress file right away."""
+            results[episode_data['episode_name']] = episode_data
+            progress_f.write(orjson.dumps(episode_data, option=orjson.OPT_APPEND_NEWLINE))
+            progress_f.flush()
         
-        episode_data = process_transcript(file_path, episode_name)
-        
-        if episode_data:
-            episodes.append(episode_data)
-            processed_count += 1
+        for i, file_path in enumerate(transcript_files, 1):
+            episode_name = file_path.stem
             
-            # Save incrementally every 10 episodes
-            if processed_count % 10 == 0:
-                metadata = {
-                    'total_episodes': len(episodes),
-                    'episodes': episodes
-                }
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
-                print(f"  Saved progress ({processed_count} new episodes processed)")
-        else:
-            failed_count += 1
+            # Skip if already processed
+            if episode_name in existing_episodes:
+                print(f"[{i}/{len(transcript_files)}] Skipping (already processed): {episode_name}")
+                results[episode_name] = existing_episodes[episode_name]
+                skipped_count += 1
+                continue
+            
+            try:
+                content, guest_name = load_transcript(file_path, episode_name)
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+                failed_count += 1
+                continue
+            
+            request = build_request(content, episode_name, guest_name)
+            cache_file = get_cache_path(request['body'])
+            ai_result = load_cached_result(cache_file)
+            if ai_result:
+                print(f"[{i}/{len(transcript_files)}] Using cached result: {episode_name}")
+                save_progress(build_episode_data(file_path, episode_name, guest_name, ai_result))
+                processed_count += 1
+                continue
+            
+            print(f"[{i}/{len(transcript_files)}] Queued: {episode_name}")
+            pending.append((file_path, episode_name, guest_name, cache_file, request))
         
-        # Rate limiting - wait between requests to avoid hitting rate limits
-        if i < len(transcript_files):
-            time.sleep(1)  # 1 second delay between requests
+        # Send every uncached episode in a single batch job
+        if pending:
+            pending_by_id = {
+                request['custom_id']: (file_path, episode_name, guest_name, cache_file)
+                for file_path, episode_name, guest_name, cache_file, request in pending
+            }
+            
+            def save_result(custom_id: str, ai_result: Dict):
+                """Cache a finished request and record its episode as soon as it arrives."""
+                if custom_id not in pending_by_id:
+                    return
+                file_path, episode_name, guest_name, cache_file = pending_by_id[custom_id]
+                save_cached_result(cache_file, ai_result)
+                save_progress(build_episode_data(file_path, episode_name, guest_name, ai_result))
+            
+            print(f"\nSubmitting {len(pending)} episodes to the Together.ai Batch API...")
+            batch_requests = [request for *_, request in pending]
+            batch_results = submit_batch(batch_requests)
+            if batch_results is None:
+                print(f"\nBatch API unavailable, sending {len(batch_requests)} direct requests "
+                      f"({MAX_WORKERS} at a time)...")
+                submit_direct_requests(batch_requests, on_result=save_result)
+            else:
+                for custom_id, ai_result in batch_results.items():
+                    save_result(custom_id, ai_result)
+                # Only forget the batch once every result is cached, so an
+                # interrupted save can still resume it instead of resubmitting
+                clear_batch_state()
+            
+            for file_path, episode_name, *_ in pending:
+                if episode_name in results:
+                    processed_count += 1
+                else:
+                    print(f"  Failed to extract metadata for {episode_name}, skipping...")
+                    failed_count += 1
+    
+    # Keep episodes in transcript file order
+    episodes = [results[f.stem] for f in transcript_files if f.stem in results]
     
-    # Final save
+    # Save once the batch has completed
     metadata = {
         'total_episodes': len(episodes),
         'episodes': episodes
     }
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    output_file.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    
+    # Everything is in the final metadata file now
+    progress_file.unlink()
     
     print(f"\n{'='*60}")
     print(f"Processing complete!")
@@ -370,4 +761,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -9,67 +9,75 @@ This script:
 4. Saves as JSONL files in Together.ai format
 """
 
+import os
+import gzip
 import json
+import hashlib
 import re
 import random
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Tuple
 from collections import defaultdict
 
+import orjson
+
 # Set random seed for reproducibility
 random.seed(42)
 
+# Transcript cleaning patterns, compiled once at import
+TIMESTAMP_RE = re.compile(r'\(\d{2}:\d{2}:\d{2}\)')
+# Speaker labels stay on their own line, so the break between speaker turns survives cleaning
+SPEAKER_LABEL_RE = re.compile(r'^[A-Za-z &.]+ :[ \t]*', re.MULTILINE)
+# Runs of spaces/tabs that need collapsing; lone spaces are never matched
+SPACES_RE = re.compile(r'\t[ \t]*| [ \t]+')
+# A paragraph is a run of non-blank lines
+PARAGRAPH_RE = re.compile(r'\S.*(?:\n[^\S\n]*\S.*)*')
+BLANK_LINES_RE = re.compile(r'\n{2,}')
+
 def clean_transcript_text(text: str) -> str:
-    """Clean transcript text by removing timestamps and normalizing whitespace."""
-    # Remove timestamps like (00:00:00)
-    text = re.sub(r'\(\d{2}:\d{2}:\d{2}\)', '', text)
-    # Remove speaker labels with timestamps at start of lines (e.g., "Ada Chen Rekhi (00:00:00):")
-    text = re.sub(r'^[A-Za-z\s&\.]+ \(00:00:00\):', '', text, flags=re.MULTILINE)
-    # Remove standalone speaker labels at start of lines (e.g., "Ryan Singer :" or "Lenny Rachitsky :")
-    text = re.sub(r'^[A-Za-z\s&\.]+ :\s*', '', text, flags=re.MULTILINE)
-    # Remove lines that are just ":" or timestamps
-    text = re.sub(r'^:\s*$', '', text, flags=re.MULTILINE)
-    # Remove lines that are just timestamps
-    text = re.sub(r'^\(\d{2}:\d{2}:\d{2}\):\s*$', '', text, flags=re.MULTILINE)
-    # Normalize whitespace
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Multiple newlines to double
-    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces to single
-    # Remove leading/trailing whitespace from each line
-    lines = [line.strip() for line in text.split('\n')]
-    text = '\n'.join([line for line in lines if line])  # Remove empty lines
-    return text.strip()
+    """
+    Clean transcript text by removing timestamps and normalizing whitespace.
+    Paragraph breaks are kept as a single blank line so the cleaned text can still be chunked.
+    """
+    # Remove timestamps like (00:00:00); this also turns speaker labels with
+    # timestamps (e.g., "Ada Chen Rekhi (00:00:00):") into "Ada Chen Rekhi :"
+    text = TIMESTAMP_RE.sub('', text)
+    # Remove speaker labels at start of lines (e.g., "Ryan Singer :" or "Lenny Rachitsky :")
+    text = SPEAKER_LABEL_RE.sub('', text)
+    # Collapse runs of spaces/tabs to a single space
+    text = SPACES_RE.sub(' ', text)
+    # Strip each line, dropping lines that only held a timestamp (":")
+    lines = (line.strip() for line in text.split('\n'))
+    text = '\n'.join(line for line in lines if line != ':')
+    # Collapse runs of blank lines into a single paragraph break
+    return BLANK_LINES_RE.sub('\n\n', text).strip()
 
 def extract_conversation_chunks(transcript: str, min_length: int = 200, max_length: int = 2000) -> List[str]:
     """
     Extract meaningful conversation chunks from transcript.
-    Splits on double newlines and creates chunks of appropriate length.
+    Groups paragraphs (separated by blank lines) into chunks of appropriate length.
+    Chunks are sliced straight out of the transcript by offset, so no paragraph
+    lists are built or joined.
     """
-    # Split by paragraphs (double newlines)
-    paragraphs = [p.strip() for p in transcript.split('\n\n') if p.strip()]
-    
     chunks = []
-    current_chunk = []
-    current_length = 0
+    chunk_start = chunk_end = 0
     
-    for para in paragraphs:
-        para_length = len(para)
+    for paragraph in PARAGRAPH_RE.finditer(transcript):
+        start, end = paragraph.span()
         
+        if not chunk_end:
+            chunk_start = start
         # If adding this paragraph would exceed max_length, save current chunk
-        if current_length + para_length > max_length and current_chunk:
-            chunk_text = '\n\n'.join(current_chunk)
-            if len(chunk_text) >= min_length:
-                chunks.append(chunk_text)
-            current_chunk = [para]
-            current_length = para_length
-        else:
-            current_chunk.append(para)
-            current_length += para_length + 2  # +2 for '\n\n'
+        elif end - chunk_start > max_length:
+            if chunk_end - chunk_start >= min_length:
+                chunks.append(transcript[chunk_start:chunk_end])
+            chunk_start = start
+        chunk_end = end
     
     # Add final chunk if it meets minimum length
-    if current_chunk:
-        chunk_text = '\n\n'.join(current_chunk)
-        if len(chunk_text) >= min_length:
-            chunks.append(chunk_text)
+    if chunk_end and chunk_end - chunk_start >= min_length:
+        chunks.append(transcript[chunk_start:chunk_end])
     
     return chunks
 
@@ -80,8 +88,8 @@ def create_instruction_prompts(chunk: str, episode_name: str) -> List[Dict[str,
     """
     examples = []
     
-    # Clean the chunk
-    cleaned_chunk = clean_transcript_text(chunk)
+    # The transcript was cleaned before chunking; paragraph breaks were only needed to chunk it
+    cleaned_chunk = chunk.replace('\n\n', '\n')
     
     # Create different prompt styles for variety
     prompt_templates = [
@@ -102,6 +110,13 @@ def create_instruction_prompts(chunk: str, episode_name: str) -> List[Dict[str,
     
     return examples
 
+def open_output(path: Path):
+    """Open an output JSONL file for writing, gzip-compressed if the name ends in .gz."""
+    if path.suffix == '.gz':
+        # Level 1 keeps compression cheap; prose JSONL still shrinks several times over
+        return gzip.open(path, 'wb', compresslevel=1)
+    return open(path, 'wb')
+
 def process_transcript_file(file_path: Path) -> List[Dict[str, str]]:
     """Process a single transcript file into instruction-completion pairs."""
     try:
@@ -115,8 +130,8 @@ def process_transcript_file(file_path: Path) -> List[Dict[str, str]]:
         if len(transcript) < 500:
             return []
         
-        # Extract conversation chunks
-        chunks = extract_conversation_chunks(transcript)
+        # Clean the whole transcript once, then extract conversation chunks
+        chunks = extract_conversation_chunks(clean_transcript_text(transcript))
         
         # Create instruction-completion pairs
         examples = []
@@ -142,8 +157,8 @@ def prepare_finetuning_data(
     
     Args:
         transcript_dir: Directory containing transcript .txt files
-        train_output: Output file for training data
-        val_output: Output file for validation data
+        train_output: Output file for training data (gzip-compressed if it ends in .gz)
+        val_output: Output file for validation data (gzip-compressed if it ends in .gz)
         val_split: Fraction of data to use for validation (0.0 to 1.0)
         min_chunk_length: Minimum length for transcript chunks
         max_chunk_length: Maximum length for transcript chunks
@@ -153,7 +168,6 @@ def prepare_finetuning_data(
     val_path = Path(val_output)
     
     # Find all .txt transcript files
-    transcript_files = []
     skip_files = {
         'requirements.txt',
         'EXTRACTION_INSTRUCTIONS.md',
@@ -165,70 +179,89 @@ def prepare_finetuning_data(
         'Failure.txt'
     }
     
-    for file_path in base_dir.glob('*.txt'):
-        if file_path.name not in skip_files:
-            transcript_files.append(file_path)
+    with os.scandir(base_dir) as entries:
+        transcript_files = [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and entry.name.endswith('.txt') and entry.name not in skip_files
+        ]
+    
+    # Visit transcripts in a seeded random order; examples are split and written
+    # as they are produced, so this is the only shuffle
+    transcript_files.sort()
+    random.shuffle(transcript_files)
     
     print(f"Found {len(transcript_files)} transcript files")
     print(f"Processing transcripts...\n")
+    print(f"Writing training data to: {train_path}")
+    print(f"Writing validation data to: {val_path}\n")
     
     # Process all transcripts
-    all_examples = []
+    seen_completions = set()
     processed_count = 0
     skipped_count = 0
+    duplicate_count = 0
+    train_count = 0
+    val_count = 0
+    train_bytes = 0
+    val_bytes = 0
+    sample_example = None
     
-    for i, file_path in enumerate(transcript_files, 1):
-        print(f"Processing {i}/{len(transcript_files)}: {file_path.name}")
-        examples = process_transcript_file(file_path)
-        
-        if examples:
-            all_examples.extend(examples)
-            processed_count += 1
-        else:
-            skipped_count += 1
-        
-        if processed_count % 50 == 0:
-            print(f"  → Processed {processed_count} episodes, {len(all_examples)} examples so far...")
-    
-    print(f"\nTotal examples created: {len(all_examples)}")
-    
-    # Shuffle examples
-    random.shuffle(all_examples)
-    
-    # Split into train and validation
-    split_idx = int(len(all_examples) * (1 - val_split))
-    train_examples = all_examples[:split_idx]
-    val_examples = all_examples[split_idx:]
-    
-    print(f"Training examples: {len(train_examples)}")
-    print(f"Validation examples: {len(val_examples)}")
-    
-    # Write training data
-    print(f"\nWriting training data to: {train_path}")
-    with open(train_path, 'w', encoding='utf-8') as f:
-        for example in train_examples:
-            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+    # Transcripts are processed in parallel; map() yields results in input order,
+    # so the train/val assignment below is the same on every run
+    with open_output(train_path) as train_f, open_output(val_path) as val_f, \
+         ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(process_transcript_file, transcript_files, chunksize=8)
+        for i, (file_path, examples) in enumerate(zip(transcript_files, results), 1):
+            print(f"Processing {i}/{len(transcript_files)}: {file_path.name}")
+            
+            if examples:
+                for example in examples:
+                    # Drop examples whose completion text was already seen
+                    digest = hashlib.blake2b(example['completion'].encode('utf-8'), digest_size=16).digest()
+                    if digest in seen_completions:
+                        duplicate_count += 1
+                        continue
+                    seen_completions.add(digest)
+                    
+                    # Send each example to validation with probability val_split
+                    line = orjson.dumps(example, option=orjson.OPT_APPEND_NEWLINE)
+                    if random.random() < val_split:
+                        val_f.write(line)
+                        val_count += 1
+                        val_bytes += len(line)
+                    else:
+                        train_f.write(line)
+                        train_count += 1
+                        train_bytes += len(line)
+                        if sample_example is None:
+                            sample_example = example
+                processed_count += 1
+            else:
+                skipped_count += 1
+            
+            if processed_count % 50 == 0:
+                print(f"  → Processed {processed_count} episodes, {train_count + val_count} examples so far...")
     
-    # Write validation data
-    print(f"Writing validation data to: {val_path}")
-    with open(val_path, 'w', encoding='utf-8') as f:
-        for example in val_examples:
-            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+    print(f"\nTotal examples created: {train_count + val_count}")
+    print(f"Duplicate examples dropped: {duplicate_count}")
     
     print(f"\n{'='*60}")
     print(f"Fine-tuning data preparation complete!")
     print(f"Processed episodes: {processed_count}")
     print(f"Skipped episodes: {skipped_count}")
-    print(f"Training examples: {len(train_examples)}")
-    print(f"Validation examples: {len(val_examples)}")
-    print(f"Training file: {train_path} ({train_path.stat().st_size / (1024*1024):.2f} MB)")
-    print(f"Validation file: {val_path} ({val_path.stat().st_size / (1024*1024):.2f} MB)")
+    print(f"Training examples: {train_count}")
+    print(f"Validation examples: {val_count}")
+    for label, path, written in (("Training", train_path, train_bytes), ("Validation", val_path, val_bytes)):
+        size = f"{path.stat().st_size / (1024*1024):.2f} MB"
+        if path.suffix == '.gz':
+            size += f", {written / (1024*1024):.2f} MB uncompressed"
+        print(f"{label} file: {path} ({size})")
     print(f"{'='*60}")
     
     # Show sample
-    if train_examples:
+    if sample_example:
         print("\nSample training example:")
-        sample = train_examples[0].copy()
+        sample = sample_example.copy()
         if len(sample['completion']) > 300:
             sample['completion'] = sample['completion'][:300] + "... [truncated]"
         print(json.dumps(sample, indent=2, ensure_ascii=False))
@@ -4,9 +4,225 @@ Script to prepare JSONL file for Together.ai batch inference.
 Transforms transcript data into the format required by Together.ai Batch API.
 """
 
+import contextlib
 import json
+import mmap
+import os
+import shutil
+import string
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+import orjson
+
+# Files are scanned and copied in 1 MB chunks
+READ_CHUNK_SIZE = 1 << 20
+# Output records are collected in memory and written out about 4 MB at a time
+WRITE_BUFFER_SIZE = 4 << 20
+# Seconds between progress messages
+PROGRESS_INTERVAL = 2.0
+
+def map_input(infile):
+    """Memory-map an input file for sequential reading (an empty file maps to b'')."""
+    if os.fstat(infile.fileno()).st_size == 0:
+        # mmap cannot map an empty file
+        return contextlib.nullcontext(b'')
+    mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return mapped
+
+def iter_lines(mapped, start: int = 0, end: int = None):
+    """Yield the lines in mapped[start:end], without their newlines."""
+    if end is None:
+        end = len(mapped)
+    find = mapped.find
+    while start < end:
+        newline = find(b'\n', start, end)
+        if newline < 0:
+            newline = end
+        yield mapped[start:newline]
+        start = newline + 1
+
+def split_template(user_prompt_template: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a template around its {transcript} placeholder into the text before and after it.
+    
+    Returns None unless the template has exactly one plain {transcript} field; other
+    templates (extra fields, format specs, malformed braces) are left to str.format.
+    """
+    try:
+        parsed = list(string.Formatter().parse(user_prompt_template))
+    except ValueError:
+        return None
+    fields = [i for i, (_, field_name, _, _) in enumerate(parsed) if field_name is not None]
+    if len(fields) != 1:
+        return None
+    _, field_name, format_spec, conversion = parsed[fields[0]]
+    if field_name != 'transcript' or format_spec or conversion:
+        return None
+    # Literal text comes back from parse() with {{ and }} already unescaped
+    prefix = ''.join(literal for literal, _, _, _ in parsed[:fields[0] + 1])
+    suffix = ''.join(literal for literal, _, _, _ in parsed[fields[0] + 1:])
+    return prefix, suffix
+
+def render_record_parts(model: str, max_tokens: int, system_prompt: str = None) -> Tuple[bytes, bytes, bytes]:
+    """
+    Pre-render a batch record around its two varying slots.
+    
+    Everything except custom_id and the user content is fixed for the run, so
+    the record is rendered once as head + custom_id + middle + content + tail
+    and only the varying fields are serialized per line.
+    """
+    messages_prefix = b''
+    if system_prompt:
+        messages_prefix = orjson.dumps({
+            "role": "system",
+            "content": system_prompt
+        }) + b','
+    record_head = b'{"custom_id":'
+    record_middle = (
+        b',"body":{"model":' + orjson.dumps(model) +
+        b',"messages":[' + messages_prefix + b'{"role":"user","content":'
+    )
+    record_tail = b'}],"max_tokens":' + orjson.dumps(max_tokens) + b'}}\n'
+    return record_head, record_middle, record_tail
+
+def convert_lines(lines, first_line_num: int, outfile, record_parts: Tuple[bytes, bytes, bytes],
+                  user_prompt_template: str = None) -> Tuple[int, int, Optional[bytes]]:
+    """
+    Convert transcript JSON lines into batch records.
+    
+    Returns the processed and skipped counts and the first record written (None if none were).
+    """
+    processed_count = 0
+    skipped_count = 0
+    first_record = None
+    record_head, record_middle, record_tail = record_parts
+    
+    # Bind the per-line callables once instead of looking them up on every line
+    loads = orjson.loads
+    dumps = orjson.dumps
+    write = outfile.write
+    monotonic = time.monotonic
+    next_progress = monotonic() + PROGRESS_INTERVAL
+    
+    # Whether a template is used is fixed for the run, so pick the user
+    # content serializer once instead of checking the template on every line
+    template_parts = split_template(user_prompt_template) if user_prompt_template else None
+    if template_parts:
+        # Splice the transcript between the template's fixed text instead of calling format()
+        prompt_prefix, prompt_suffix = template_parts
+        def dump_user_content(transcript_text):
+            return dumps(prompt_prefix + transcript_text + prompt_suffix)
+    elif user_prompt_template:
+        format_prompt = user_prompt_template.format
+        def dump_user_content(transcript_text):
+            return dumps(format_prompt(transcript=transcript_text))
+    else:
+        dump_user_content = dumps
+    
+    out_buf = bytearray()
+    for line_num, line in enumerate(lines, first_line_num):
+        try:
+            # Parse the input JSON (orjson skips surrounding whitespace such as a CRLF "\r")
+            data = loads(line)
+            
+            # Get the custom_id (truncate to 64 chars max as per API requirement;
+            # slicing leaves shorter ids unchanged). The default id is only
+            # formatted for records that have no id.
+            try:
+                custom_id = data['id']
+            except KeyError:
+                custom_id = f'episode-{line_num}'
+            custom_id = custom_id[:64]
+            
+            # Get the transcript text (a missing key is rare, so index rather than .get())
+            try:
+                transcript_text = data['text']
+            except KeyError:
+                transcript_text = None
+            
+            if not transcript_text:
+                print(f"Warning: Line {line_num} has no text, skipping...")
+                skipped_count += 1
+                continue
+            
+            # Fill the pre-rendered record and add it to the output buffer
+            custom_id_json = dumps(custom_id)
+            user_content_json = dump_user_content(transcript_text)
+            out_buf += record_head
+            out_buf += custom_id_json
+            out_buf += record_middle
+            out_buf += user_content_json
+            out_buf += record_tail
+            if first_record is None:
+                # Kept for the sample shown at the end
+                first_record = record_head + custom_id_json + record_middle + user_content_json + record_tail
+            if len(out_buf) >= WRITE_BUFFER_SIZE:
+                write(out_buf)
+                out_buf.clear()
+            processed_count += 1
+            
+            # Report progress on a timer, so long runs print a bounded number of lines
+            if monotonic() >= next_progress:
+                print(f"Processed {processed_count} episodes...")
+                next_progress = monotonic() + PROGRESS_INTERVAL
+                
+        except orjson.JSONDecodeError as e:
+            print(f"Error parsing line {line_num}: {e}")
+            skipped_count += 1
+            continue
+        except Exception as e:
+            print(f"Error processing line {line_num}: {e}")
+            skipped_count += 1
+            continue
+    
+    write(out_buf)
+    return processed_count, skipped_count, first_record
+
+def split_input(input_path: Path, workers: int) -> List[Tuple[int, int, int]]:
+    """
+    Split a JSONL file into up to `workers` byte ranges that start on line boundaries.
+    
+    Returns (start, end, first_line_num) for each range.
+    """
+    size = input_path.stat().st_size
+    starts = [0]
+    with open(input_path, 'rb') as f:
+        for i in range(1, workers):
+            # Move to the start of the line after the nominal split point
+            f.seek(max(size * i // workers - 1, starts[-1]))
+            f.readline()
+            offset = f.tell()
+            if starts[-1] < offset < size:
+                starts.append(offset)
+        
+        # Count the lines before each range so line numbers (and default ids) stay global
+        ranges = []
+        line_num = 1
+        f.seek(0)
+        for start, end in zip(starts, starts[1:] + [size]):
+            ranges.append((start, end, line_num))
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                line_num += chunk.count(b'\n')
+    return ranges
+
+def convert_part(part: tuple) -> Tuple[int, int, Optional[bytes]]:
+    """Convert one byte range of the input into its own part file (runs in a worker process)."""
+    input_path, start, end, first_line_num, part_path, record_parts, user_prompt_template = part
+    with open(input_path, 'rb') as infile, map_input(infile) as mapped, \
+         open(part_path, 'wb') as outfile:
+        return convert_lines(iter_lines(mapped, start, end), first_line_num, outfile,
+                             record_parts, user_prompt_template)
 
 def prepare_batch_file(
     input_file: str,
@@ -14,7 +230,8 @@ def prepare_batch_file(
     model: str = "meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo",
     max_tokens: int = 4000,
     system_prompt: str = None,
-    user_prompt_template: str = None
+    user_prompt_template: str = None,
+    workers: int = 1
 ):
     """
     Transform transcript JSONL to Together.ai batch format.
@@ -27,6 +244,7 @@ def prepare_batch_file(
         system_prompt: Optional system prompt to prepend
         user_prompt_template: Optional template for user message. Use {transcript} as placeholder.
                             If None, transcript is used directly as user content.
+        workers: Number of processes to split the input across (1 converts in this process)
     """
     input_path = Path(input_file)
     output_path = Path(output_file)
@@ -41,74 +259,34 @@ def prepare_batch_file(
     print(f"Max tokens: {max_tokens}")
     print()
     
-    processed_count = 0
-    skipped_count = 0
+    record_parts = render_record_parts(model, max_tokens, system_prompt)
     
-    with open(input_path, 'r', encoding='utf-8') as infile, \
-         open(output_path, 'w', encoding='utf-8') as outfile:
+    ranges = split_input(input_path, workers) if workers > 1 else []
+    if len(ranges) > 1:
+        # Each worker converts its own byte range into a part file; the parts
+        # are then joined in input order so the output matches a serial run
+        part_paths = [output_path.with_name(f"{output_path.name}.part{i}") for i in range(len(ranges))]
+        parts = [
+            (input_path, start, end, first_line_num, part_path, record_parts, user_prompt_template)
+            for (start, end, first_line_num), part_path in zip(ranges, part_paths)
+        ]
+        with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+            counts = list(executor.map(convert_part, parts))
+        processed_count = sum(processed for processed, _, _ in counts)
+        skipped_count = sum(skipped for _, skipped, _ in counts)
+        first_record = next((record for _, _, record in counts if record is not None), None)
         
-        for line_num, line in enumerate(infile, 1):
-            try:
-                # Parse the input JSON
-                data = json.loads(line.strip())
-                
-                # Get the custom_id (truncate to 64 chars max as per API requirement)
-                custom_id = data.get('id', f'episode-{line_num}')
-                if len(custom_id) > 64:
-                    custom_id = custom_id[:64]
-                
-                # Get the transcript text
-                transcript_text = data.get('text', '')
-                
-                if not transcript_text:
-                    print(f"Warning: Line {line_num} has no text, skipping...")
-                    skipped_count += 1
-                    continue
-                
-                # Build messages array
-                messages = []
-                if system_prompt:
-                    messages.append({
-                        "role": "system",
-                        "content": system_prompt
-                    })
-                
-                # Format user message
-                if user_prompt_template:
-                    user_content = user_prompt_template.format(transcript=transcript_text)
-                else:
-                    user_content = transcript_text
-                
-                messages.append({
-                    "role": "user",
-                    "content": user_content
-                })
-                
-                # Create the batch request body
-                batch_request = {
-                    "custom_id": custom_id,
-                    "body": {
-                        "model": model,
-                        "messages": messages,
-                        "max_tokens": max_tokens
-                    }
-                }
-                
-                # Write as JSON line
-                outfile.write(json.dumps(batch_request, ensure_ascii=False) + '\n')
-                processed_count += 1
-                
-                if processed_count % 50 == 0:
-                    print(f"Processed {processed_count} episodes...")
-                    
-            except json.JSONDecodeError as e:
-                print(f"Error parsing line {line_num}: {e}")
-                skipped_count += 1
-                continue
-            except Exception as e:
-                print(f"Error processing line {line_num}: {e}")
-                skipped_count += 1
-                continue
+        with open(output_path, 'wb') as outfile:
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, outfile, READ_CHUNK_SIZE)
+                os.remove(part_path)
+    else:
+        with open(input_path, 'rb') as infile, map_input(infile) as mapped, \
+             open(output_path, 'wb') as outfile:
+            processed_count, skipped_count, first_record = convert_lines(
+                iter_lines(mapped), 1, outfile, record_parts, user_prompt_template
+            )
     
     print(f"\n{'='*60}")
     print(f"Conversion complete!")
@@ -119,17 +297,15 @@ def prepare_batch_file(
     print(f"{'='*60}")
     
     # Show sample
-    if processed_count > 0:
+    if first_record is not None:
         print("\nSample batch request (first line):")
-        with open(output_path, 'r', encoding='utf-8') as f:
-            first_line = f.readline()
-            sample = json.loads(first_line)
-            # Truncate content for display
-            if 'body' in sample and 'messages' in sample['body']:
-                for msg in sample['body']['messages']:
-                    if 'content' in msg and len(msg['content']) > 200:
-                        msg['content'] = msg['content'][:200] + "... [truncated]"
-            print(json.dumps(sample, indent=2))
+        sample = orjson.loads(first_record)
+        # Truncate content for display
+        if 'body' in sample and 'messages' in sample['body']:
+            for msg in sample['body']['messages']:
+                if 'content' in msg and len(msg['content']) > 200:
+                    msg['content'] = msg['content'][:200] + "... [truncated]"
+        print(json.dumps(sample, indent=2))
 
 if __name__ == '__main__':
     # Default values
@@ -139,9 +315,10 @@ if __name__ == '__main__':
     max_tokens = 4000
     system_prompt = None
     user_prompt_template = None
+    workers = 1
     
     # Allow command line arguments
-    # Usage: python prepare_together_batch.py [input] [output] [model] [max_tokens] [system_prompt_file] [user_prompt_template_file]
+    # Usage: python prepare_together_batch.py [input] [output] [model] [max_tokens] [system_prompt_file] [user_prompt_template_file] [workers]
     if len(sys.argv) > 1:
         input_file = sys.argv[1]
     if len(sys.argv) > 2:
@@ -150,7 +327,7 @@ if __name__ == '__main__':
         model = sys.argv[3]
     if len(sys.argv) > 4:
         max_tokens = int(sys.argv[4])
-    if len(sys.argv) > 5:
+    if len(sys.argv) > 5 and sys.argv[5]:
         # 5th argument: system prompt file path
         prompt_file = Path(sys.argv[5])
         if prompt_file.exists():
@@ -158,7 +335,7 @@ if __name__ == '__main__':
             print(f"Loaded system prompt from: {prompt_file}")
         else:
             print(f"Warning: System prompt file {prompt_file} not found. Using no system prompt.")
-    if len(sys.argv) > 6:
+    if len(sys.argv) > 6 and sys.argv[6]:
         # 6th argument: user prompt template file path
         template_file = Path(sys.argv[6])
         if template_file.exists():
@@ -166,6 +343,9 @@ if __name__ == '__main__':
             print(f"Loaded user prompt template from: {template_file}")
         else:
             print(f"Warning: User prompt template file {template_file} not found.")
+    if len(sys.argv) > 7:
+        # 7th argument: number of worker processes (pass "" to skip the prompt files)
+        workers = int(sys.argv[7])
     
-    prepare_batch_file(input_file, output_file, model, max_tokens, system_prompt, user_prompt_template)
+    prepare_batch_file(input_file, output_file, model, max_tokens, system_prompt, user_prompt_template, workers)
 
@@ -21,11 +21,14 @@ base_dir = Path(__file__).parent
 test_file = base_dir / "Brian Chesky.txt"
 
 if not test_file.exists():
-    # Try to find any episode
-    transcript_files = list(base_dir.glob('*.txt'))
-    if transcript_files:
-        test_file = transcript_files[0]
-    else:
+    # Try to find any episode, stopping at the first transcript
+    with os.scandir(base_dir) as entries:
+        test_file = next(
+            (Path(entry.path) for entry in entries
+             if entry.is_file() and entry.name.endswith('.txt') and entry.name != 'requirements.txt'),
+            None
+        )
+    if test_file is None:
         print("No transcript files found!")
         exit(1)
 